@@ -1,5 +1,5 @@
 import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
+from tkinter import filedialog, messagebox, simpledialog, ttk
 import os
 import random
 import string
@@ -10,7 +10,21 @@ import tempfile
 import cairosvg
 import sys
 import mimetypes
-from PIL import Image, ImageGrab
+import argparse
+import collections
+import csv
+import json
+import mmap
+import threading
+import concurrent.futures
+import hashlib
+import io
+import struct
+import sqlite3
+import time
+import urllib.parse
+from PIL import Image, ImageChops, ImageGrab, ImageTk
+import pythoncom
 import win32com.client
 from tkinterdnd2 import TkinterDnD, DND_FILES
 
@@ -26,6 +40,58 @@ else:
 SOURCE_DIR_FILE = os.path.join(BASE_DIR, "_sourcedir.txt")
 BACKUP_DIR_FILE = os.path.join(BASE_DIR, "_backupdir.txt")
 OMIT_PURGE_FILE = os.path.join(BASE_DIR, "_omitpurge.txt")
+ICON_SIZES_FILE = os.path.join(BASE_DIR, "_iconsizes.txt")
+
+# Shortcut audit report columns and statuses
+AUDIT_FIELDS = ["path", "target", "icon", "status", "error"]
+AUDIT_STATUSES = ["ok", "missing_icon", "missing_target", "foreign_icon", "unreadable"]
+
+# Standard icon sizes Windows expects, used when _iconsizes.txt is missing or blank
+DEFAULT_ICON_SIZES = [16, 32, 48, 64, 128, 256]
+
+# ICO optimization: frames at least this wide are stored as optimized PNG, smaller ones
+# as uncompressed 32-bit bitmaps; 0 stores every frame as PNG
+PNG_FRAME_MIN_SIZE = 0
+
+# Icon library catalogue, kept in the first source directory
+CATALOGUE_FILE_NAME = "_catalogue.db"
+THUMBNAIL_FILE_NAME = "_thumbnails.bin"
+THUMBNAIL_SIZE = 32
+THUMBNAIL_BYTES = THUMBNAIL_SIZE * THUMBNAIL_SIZE * 4  # One RGBA slot in the thumbnail file
+
+CATALOGUE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS icons (
+    path TEXT PRIMARY KEY,
+    name TEXT COLLATE NOCASE,
+    origin_kind TEXT,
+    origin TEXT COLLATE NOCASE,
+    source_hash TEXT,
+    sizes TEXT,
+    width INTEGER,
+    height INTEGER,
+    file_size INTEGER,
+    mtime_ns INTEGER,
+    thumb_slot INTEGER,
+    added REAL
+);
+CREATE TABLE IF NOT EXISTS tags (
+    path TEXT,
+    tag TEXT COLLATE NOCASE,
+    PRIMARY KEY (path, tag)
+);
+CREATE TABLE IF NOT EXISTS shortcuts (
+    path TEXT,
+    shortcut TEXT,
+    PRIMARY KEY (path, shortcut)
+);
+CREATE INDEX IF NOT EXISTS icons_name ON icons (name);
+CREATE INDEX IF NOT EXISTS icons_origin ON icons (origin);
+CREATE INDEX IF NOT EXISTS icons_origin_kind ON icons (origin_kind);
+CREATE INDEX IF NOT EXISTS icons_source_hash ON icons (source_hash);
+CREATE INDEX IF NOT EXISTS icons_thumb_slot ON icons (thumb_slot);
+CREATE INDEX IF NOT EXISTS tags_tag ON tags (tag);
+CREATE INDEX IF NOT EXISTS shortcuts_shortcut ON shortcuts (shortcut);
+"""
 
 def convert_svg_to_png(svg_path, output_path):
     try:
@@ -34,14 +100,6 @@ def convert_svg_to_png(svg_path, output_path):
     except Exception as e:
         raise ValueError(f"Failed to convert SVG to PNG: {e}")
 
-def read_directory_from_file(file_path):
-    try:
-        with open(file_path, 'r', encoding='utf-8-sig') as f:
-            directory = f.read().strip()
-        return directory
-    except Exception as e:
-        raise FileNotFoundError(f"Failed to read {file_path}: {e}")
-
 def ensure_valid_directory(directory_path):
     if not directory_path:
         raise ValueError("Directory path is empty!")
@@ -55,98 +113,223 @@ def ensure_valid_directory(directory_path):
         except Exception as e:
             raise OSError(f"Failed to create directory '{directory_path}': {e}")
 
-def validate_sourcedir():
-    # Check if the file exists
-    if not os.path.exists(SOURCE_DIR_FILE):
-        messagebox.showerror("Error", "_sourcedir.txt file is missing!")
-        return False
+def profile_file_path(file_path, profile=None):
+    # "_sourcedir.txt" becomes "_sourcedir.<profile>.txt" for a named profile
+    if not profile:
+        return file_path
+    root_name, extension = os.path.splitext(file_path)
+    return f"{root_name}.{profile}{extension}"
+
+class ConopidaConfig:
+    """Validated snapshot of the _sourcedir, _backupdir, _omitpurge and _iconsizes files.
+
+    The files are read and validated once and only re-read by reload() when
+    one of their modification times changes. Validation never creates
+    directories; callers do that where they write files. Errors are collected as messages
+    instead of being shown, so the GUI and headless commands can report them
+    in their own way.
+    """
+
+    def __init__(self, profile=None):
+        self.profile = profile or None
+        self._mtimes = None
+        self.reload(force=True)
+
+    def _resolve_files(self):
+        # A profile must have its own source list; the other files fall back to the defaults
+        # until a profile variant is created
+        def profile_or_default(file_path):
+            candidate = profile_file_path(file_path, self.profile)
+            return candidate if os.path.exists(candidate) else file_path
+
+        self.source_file = profile_file_path(SOURCE_DIR_FILE, self.profile)
+        self.backup_file = profile_or_default(BACKUP_DIR_FILE)
+        self.omit_file = profile_or_default(OMIT_PURGE_FILE)
+        self.icon_sizes_file = profile_or_default(ICON_SIZES_FILE)
+
+    @property
+    def source_dir(self):
+        # New icons always go to the first listed source directory
+        return self.source_dirs[0] if self.source_dirs else None
+
+    def _file_mtimes(self):
+        # Paths are part of the key, so switching to a new profile variant also reloads
+        mtimes = []
+        for file_path in (self.source_file, self.backup_file, self.omit_file, self.icon_sizes_file):
+            try:
+                mtimes.append((file_path, os.stat(file_path).st_mtime_ns))
+            except OSError:
+                mtimes.append((file_path, None))
+        return tuple(mtimes)
+
+    def reload(self, force=False):
+        self._resolve_files()
+        mtimes = self._file_mtimes()
+        if not force and mtimes == self._mtimes:
+            return False
 
-    try:
-        # Read the contents of the file
-        with open(SOURCE_DIR_FILE, 'r', encoding='utf-8-sig') as f:
-            source_dir = f.read().strip()
-    except Exception as e:
-        messagebox.showerror("Error", f"Failed to read _sourcedir.txt: {e}")
-        return False
+        self._mtimes = mtimes
+        self._load_source()
+        self._load_backup()
+        self._load_omit()
+        self._load_icon_sizes()
+        return True
 
-    # Check if the path is empty or invalid
-    if not source_dir:
-        messagebox.showerror("Error", "_sourcedir.txt is blank!")
-        return False
+    def _read_lines(self, file_path):
+        with open(file_path, 'r', encoding='utf-8-sig') as f:
+            return [line.strip() for line in f]
 
-    # Ensure the path is absolute (avoiding ambiguous or invalid entries like "abc")
-    if not os.path.isabs(source_dir):
-        messagebox.showerror("Error", f"Invalid directory path in _sourcedir.txt: '{source_dir}' must be an absolute path!")
-        return False
+    def _load_source(self):
+        self.source_dirs = []
+        self.source_error = None
+        file_name = os.path.basename(self.source_file)
+
+        if not os.path.exists(self.source_file):
+            self.source_error = f"{file_name} file is missing!"
+            return
 
-    # Attempt to create the directory if it doesn't exist
-    if not os.path.exists(source_dir):
         try:
-            os.makedirs(source_dir)
+            lines = [line for line in self._read_lines(self.source_file) if line]
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to create source directory '{source_dir}': {e}")
-            return False
+            self.source_error = f"Failed to read {file_name}: {e}"
+            return
 
-    return True
+        if not lines:
+            self.source_error = f"{file_name} is blank!"
+            return
 
-def validate_backupdir():
-    try:
-        # Check if the backup file exists
-        if not os.path.exists(BACKUP_DIR_FILE):
-            return None  # If the file doesn't exist, skip and return None
+        for source_dir in lines:
+            # Avoid ambiguous or invalid entries like "abc"
+            if not os.path.isabs(source_dir):
+                self.source_error = f"Invalid directory path in {file_name}: '{source_dir}' must be an absolute path!"
+                self.source_dirs = []
+                return
+            # Missing directories are created when an icon is first written to them
+            if os.path.exists(source_dir) and not os.path.isdir(source_dir):
+                self.source_error = f"Invalid directory path in {file_name}: '{source_dir}' is not a directory!"
+                self.source_dirs = []
+                return
+            source_dir = os.path.abspath(source_dir)
+            if source_dir not in self.source_dirs:
+                self.source_dirs.append(source_dir)
 
-        # Read the contents of the file
-        with open(BACKUP_DIR_FILE, 'r', encoding='utf-8-sig') as f:
-            backup_dir = f.read().strip()
+    def _load_backup(self):
+        self.backup_dir = None
+        self.backup_error = None
+        file_name = os.path.basename(self.backup_file)
 
-        # If the backup directory is empty, contains only spaces or tabs, return None
-        if not backup_dir:
-            return None
+        # A missing or blank file simply disables backups
+        if not os.path.exists(self.backup_file):
+            return
 
-        # Ensure the path is absolute
+        try:
+            lines = [line for line in self._read_lines(self.backup_file) if line]
+        except Exception as e:
+            self.backup_error = f"Failed to read {file_name}: {e}"
+            return
+
+        if not lines:
+            return
+
+        backup_dir = lines[0]
         if not os.path.isabs(backup_dir):
-            messagebox.showerror("Error", f"Invalid directory path in _backupdir.txt: '{backup_dir}' must be an absolute path!")
-            return None
+            self.backup_error = f"Invalid directory path in {file_name}: '{backup_dir}' must be an absolute path!"
+            return
 
-        # Attempt to create the directory if it doesn't exist
-        if not os.path.exists(backup_dir):
-            try:
-                os.makedirs(backup_dir)
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to create backup directory '{backup_dir}': {e}")
-                return None
+        # Created on the first backup, not while validating
+        if os.path.exists(backup_dir) and not os.path.isdir(backup_dir):
+            self.backup_error = f"Invalid directory path in {file_name}: '{backup_dir}' is not a directory!"
+            return
 
-        return backup_dir
-    except Exception as e:
-        messagebox.showerror("Error", f"Failed to read _backupdir.txt: {e}")
-        return None
+        self.backup_dir = os.path.abspath(backup_dir)
 
-def validate_omitdir(file_path=OMIT_PURGE_FILE):
-    omit_dirs = []
-    errors = []
+    def _load_omit(self):
+        # omit_dirs is None when the purge must not run at all
+        self.omit_dirs = None
+        self.omit_errors = []
+        self.omit_error = None
+        omit_dirs = []
 
-    try:
-        with open(file_path, 'r', encoding='utf-8-sig') as f:
-            for line_num, line in enumerate(f, start=1):
-                omit_dir = line.strip()
-                if omit_dir:
-                    if not os.path.isabs(omit_dir):
-                        errors.append(f"Line {line_num}: '{omit_dir}' is not an absolute path.")
-                    elif not os.path.exists(omit_dir):
-                        errors.append(f"Line {line_num}: '{omit_dir}' does not exist.")
-                    else:
-                        omit_dirs.append(os.path.abspath(omit_dir))
-    except Exception as e:
-        messagebox.showerror("Error", f"Failed to read {file_path}: {e}")
-        return None, []
+        try:
+            lines = self._read_lines(self.omit_file)
+        except Exception as e:
+            self.omit_error = f"Failed to read {self.omit_file}: {e}"
+            return
 
-    # Critical condition: no valid paths AND there were errors
-    if not omit_dirs and errors:
-        errors.append("\nProcess stopped to prevent data loss.")
-        messagebox.showerror("Validation Error", "\n".join(errors))
-        return None, []
+        for line_num, omit_dir in enumerate(lines, start=1):
+            if omit_dir:
+                if not os.path.isabs(omit_dir):
+                    self.omit_errors.append(f"Line {line_num}: '{omit_dir}' is not an absolute path.")
+                elif not os.path.exists(omit_dir):
+                    self.omit_errors.append(f"Line {line_num}: '{omit_dir}' does not exist.")
+                else:
+                    omit_dirs.append(os.path.abspath(omit_dir))
+
+        # Critical condition: no valid paths AND there were errors
+        if not omit_dirs and self.omit_errors:
+            return
+
+        self.omit_dirs = omit_dirs
+
+    def _load_icon_sizes(self):
+        # Sizes separated by commas or whitespace, e.g. "16 32 48 256";
+        # None when no size set is configured
+        self.icon_sizes = None
+        self.icon_sizes_error = None
+        file_name = os.path.basename(self.icon_sizes_file)
+
+        if not os.path.exists(self.icon_sizes_file):
+            return
+
+        try:
+            entries = " ".join(self._read_lines(self.icon_sizes_file)).replace(",", " ").split()
+        except Exception as e:
+            self.icon_sizes_error = f"Failed to read {file_name}: {e}"
+            return
+
+        if not entries:
+            return
+
+        sizes = set()
+        for entry in entries:
+            if not entry.isdigit() or not 1 <= int(entry) <= 256:
+                self.icon_sizes_error = f"Invalid icon size in {file_name}: '{entry}' must be a number from 1 to 256!"
+                return
+            sizes.add(int(entry))
+        self.icon_sizes = sorted(sizes)
 
-    return omit_dirs, errors
+def validate_sourcedir():
+    config.reload()
+    if config.source_error:
+        messagebox.showerror("Error", config.source_error)
+        return False
+    return True
+
+def validate_backupdir():
+    config.reload()
+    if config.backup_error:
+        messagebox.showerror("Error", config.backup_error)
+    return config.backup_dir
+
+def validate_omitdir():
+    config.reload()
+    if config.omit_error:
+        messagebox.showerror("Error", config.omit_error)
+        return None, []
+    if config.omit_dirs is None:
+        messagebox.showerror("Validation Error", "\n".join(config.omit_errors + ["\nProcess stopped to prevent data loss."]))
+        return None, []
+    return config.omit_dirs, config.omit_errors
+
+def copy_icons_to_backup(source_dirs, backup_dir):
+    # Copy all .ico files from the source directories to the backup directory
+    ensure_valid_directory(backup_dir)
+    for source_dir in source_dirs:
+        if not os.path.isdir(source_dir):
+            continue
+        for file_name in os.listdir(source_dir):
+            if file_name.lower().endswith(".ico"):
+                shutil.copy(os.path.join(source_dir, file_name), os.path.join(backup_dir, file_name))
 
 def backup_ico_files():
     # Validate the backup directory
@@ -157,18 +340,11 @@ def backup_ico_files():
         return
 
     try:
-        source_dir = read_directory_from_file(SOURCE_DIR_FILE)
-
-        if not source_dir or not os.path.exists(source_dir):
+        if not config.source_dirs:
             messagebox.showerror("Error", "Invalid source directory!")
             return
 
-        # Copy all .ico files from the source directory to the backup directory
-        for file_name in os.listdir(source_dir):
-            if file_name.lower().endswith(".ico"):
-                source_file_path = os.path.join(source_dir, file_name)
-                backup_file_path = os.path.join(backup_dir, file_name)
-                shutil.copy(source_file_path, backup_file_path)
+        copy_icons_to_backup(config.source_dirs, backup_dir)
 
     except Exception as e:
         messagebox.showerror("Warning", f"Failed to backup ICO files: {e}")
@@ -177,8 +353,9 @@ def generate_crc32_name():
     random_string = ''.join(random.choices(string.ascii_letters, k=50))
     return f"{zlib.crc32(random_string.encode()):08x}"
 
-def create_icon_with_multiple_sizes(image_path, save_directory):
+def create_icon_with_multiple_sizes(image_path, save_directory, sizes=None, png_min_size=PNG_FRAME_MIN_SIZE):
     try:
+        ensure_valid_directory(save_directory)
         icon_name = f"{generate_crc32_name()}.ico"
         icon_save_path = os.path.join(save_directory, icon_name)
 
@@ -188,16 +365,531 @@ def create_icon_with_multiple_sizes(image_path, save_directory):
         # Ensure image has an alpha channel for transparency
         img = img.convert("RGBA")
 
-        # Define standard icon sizes Windows expects
-        sizes = [16, 32, 48, 64, 128, 256]
-
-        # Save the image as an ICO file with multiple sizes
-        img.save(icon_save_path, format='ICO', sizes=[(size, size) for size in sizes])
+        # Render each requested size; like Pillow's ICO writer, never upscale the source
+        frames = []
+        for size in sorted(sizes or DEFAULT_ICON_SIZES):
+            if size > img.width or size > img.height:
+                continue
+            frame = img.copy()
+            frame.thumbnail((size, size), Image.LANCZOS)
+            frames.append(frame)
+        if not frames:
+            frame = img.copy()
+            frame.thumbnail((256, 256), Image.LANCZOS)
+            frames.append(frame)
+
+        # Save the image as an optimized ICO file with multiple sizes
+        with open(icon_save_path, 'wb') as f:
+            f.write(encode_ico(drop_upscaled_frames(frames), png_min_size))
 
         return icon_save_path
     except Exception as e:
         raise OSError(f"Failed to create icon: {e}")
 
+def best_ico_entries(ico):
+    # Index of the entry with the highest color depth for each frame size
+    best = {}
+    for index, header in enumerate(ico.ico.entry):
+        if header.dim not in best or header.color_depth > ico.ico.entry[best[header.dim]].color_depth:
+            best[header.dim] = index
+    return best
+
+def read_ico_frames(icon_file):
+    # One RGBA image per frame size; duplicate entries at lower bit depths are dropped
+    with Image.open(icon_file) as ico:
+        if ico.format != "ICO":
+            raise ValueError("Not an ICO file")
+        best = best_ico_entries(ico)
+        return [ico.ico.frame(best[size]).convert("RGBA") for size in sorted(best)]
+
+def is_upscaled_frame(frame, smaller):
+    # True when the frame is a pixel-replicated (nearest neighbour) upscale of a smaller frame
+    difference = ImageChops.difference(frame, smaller.resize(frame.size, Image.NEAREST))
+    return all(high == 0 for _, high in difference.getextrema())
+
+def drop_upscaled_frames(frames):
+    # The largest frame is always kept for jumbo and high-DPI views; an intermediate
+    # frame that only repeats the pixels of a smaller one adds nothing but bytes
+    frames = sorted(frames, key=lambda frame: frame.size)
+    kept = []
+    for frame in frames[:-1]:
+        if not any(is_upscaled_frame(frame, smaller) for smaller in kept):
+            kept.append(frame)
+    return kept + frames[-1:]
+
+def encode_dib_frame(frame):
+    # 32-bit bottom-up bitmap; the height covers the XOR and AND masks, and the AND mask stays
+    # empty because the alpha channel already carries the transparency
+    width, height = frame.size
+    header = struct.pack("<IiiHHIIiiII", 40, width, height * 2, 1, 32, 0, 0, 0, 0, 0, 0)
+    pixels = frame.transpose(Image.FLIP_TOP_BOTTOM).tobytes("raw", "BGRA")
+    mask = bytes(((width + 31) // 32) * 4 * height)
+    return header + pixels + mask
+
+def encode_ico(frames, png_min_size=PNG_FRAME_MIN_SIZE):
+    images = []
+    for frame in sorted(frames, key=lambda frame: frame.size):
+        if frame.width >= png_min_size:
+            buffer = io.BytesIO()
+            frame.save(buffer, format="PNG", optimize=True)
+            images.append((frame.size, buffer.getvalue()))
+        else:
+            images.append((frame.size, encode_dib_frame(frame)))
+
+    # ICONDIR header followed by one 16-byte ICONDIRENTRY per frame (256 is stored as 0)
+    data = [struct.pack("<HHH", 0, 1, len(images))]
+    offset = 6 + 16 * len(images)
+    for (width, height), image in images:
+        data.append(struct.pack("<BBBBHHII", width % 256, height % 256, 0, 0, 1, 32, len(image), offset))
+        offset += len(image)
+    data.extend(image for _, image in images)
+    return b"".join(data)
+
+def optimize_icon_file(icon_path, sizes=None, png_min_size=PNG_FRAME_MIN_SIZE, dry_run=False):
+    # Rewrite an existing ICO with the given size set; returns (old size, new size).
+    # The file is only replaced when the result is smaller.
+    with open(icon_path, 'rb') as f:
+        original = f.read()
+    frames = read_ico_frames(io.BytesIO(original))
+
+    # Restrict to a configured size set, unless the icon has none of those sizes at all
+    wanted = [frame for frame in frames if frame.width in sizes] if sizes else frames
+    optimized = encode_ico(drop_upscaled_frames(wanted or frames), png_min_size)
+
+    if len(optimized) >= len(original):
+        return len(original), len(original)
+
+    if not dry_run:
+        temp_path = f"{icon_path}.{generate_crc32_name()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(optimized)
+        os.replace(temp_path, icon_path)
+    return len(original), len(optimized)
+
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def origin_name(origin_kind, origin):
+    # A readable name for the catalogue, e.g. "firefox" for ".../firefox.png"
+    if origin_kind == "clipboard":
+        return "clipboard"
+    if origin_kind == "url":
+        origin = urllib.parse.urlparse(origin).path
+    return os.path.splitext(os.path.basename(origin.rstrip("/\\")))[0]
+
+def ico_frame(ico, size):
+    # Smallest frame that is at least `size` pixels wide, or the largest one
+    sizes = sorted(ico.info.get("sizes", [ico.size]))
+    frame_size = next((s for s in sizes if s[0] >= size), sizes[-1])
+    return ico.ico.frame(best_ico_entries(ico)[frame_size]).convert("RGBA")
+
+def render_thumbnail(image):
+    # Fit the image into a transparent THUMBNAIL_SIZE square
+    thumbnail = image.convert("RGBA")
+    thumbnail.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.LANCZOS)
+    canvas = Image.new("RGBA", (THUMBNAIL_SIZE, THUMBNAIL_SIZE), (0, 0, 0, 0))
+    canvas.paste(thumbnail, ((THUMBNAIL_SIZE - thumbnail.width) // 2, (THUMBNAIL_SIZE - thumbnail.height) // 2))
+    return canvas.tobytes()
+
+class IconCatalogue:
+    """Searchable index of the icons kept in the source directories.
+
+    Metadata (origin, source hash, frame sizes, dimensions, tags and the
+    shortcuts using each icon) lives in an SQLite database next to the icons.
+    Thumbnails are fixed-size RGBA slots packed into a single file, so a
+    picker can show the whole library without decoding a single ICO.
+    """
+
+    def __init__(self, directory):
+        ensure_valid_directory(directory)
+        self.db_path = os.path.join(directory, CATALOGUE_FILE_NAME)
+        self.thumbnail_path = os.path.join(directory, THUMBNAIL_FILE_NAME)
+        self.db = sqlite3.connect(self.db_path)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(CATALOGUE_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def contains(self, icon_path):
+        row = self.db.execute("SELECT 1 FROM icons WHERE path = ?", (os.path.abspath(icon_path),)).fetchone()
+        return row is not None
+
+    def add_icon(self, icon_path, origin_kind, origin="", source_path=None, free_slots=None, commit=True):
+        icon_path = os.path.abspath(icon_path)
+        source_path = source_path or icon_path
+        name = origin_name(origin_kind, origin) or os.path.splitext(os.path.basename(icon_path))[0]
+
+        # Decode before touching the database, so an unreadable icon leaves no partial row
+        icon_info = self._read_icon(icon_path)
+
+        # Dimensions of the original image; falls back to the largest frame for SVG or ICO sources
+        width = height = None
+        try:
+            with Image.open(source_path) as source_image:
+                if not source_path.lower().endswith(".ico"):
+                    width, height = source_image.size
+        except Exception:
+            pass
+
+        self.db.execute(
+            "INSERT INTO icons (path, name, origin_kind, origin, source_hash, width, height, added) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(path) DO UPDATE SET name = excluded.name, origin_kind = excluded.origin_kind, "
+            "origin = excluded.origin, source_hash = excluded.source_hash, width = excluded.width, "
+            "height = excluded.height",
+            (icon_path, name, origin_kind, origin, file_sha256(source_path), width, height, time.time())
+        )
+        self._store_icon(icon_path, icon_info, free_slots)
+        if commit:
+            self.db.commit()
+
+    def refresh_icon(self, icon_path, free_slots=None, commit=True):
+        # Re-read the frame sizes and thumbnail after the ICO file itself changed
+        icon_path = os.path.abspath(icon_path)
+        self._store_icon(icon_path, self._read_icon(icon_path), free_slots)
+        if commit:
+            self.db.commit()
+
+    def _read_icon(self, icon_path):
+        stat = os.stat(icon_path)
+        with Image.open(icon_path) as ico:
+            sizes = sorted(ico.info.get("sizes", [ico.size]))
+            thumbnail = render_thumbnail(ico_frame(ico, THUMBNAIL_SIZE))
+        return sizes, thumbnail, stat
+
+    def _store_icon(self, icon_path, icon_info, free_slots=None):
+        sizes, thumbnail, stat = icon_info
+
+        row = self.db.execute("SELECT thumb_slot FROM icons WHERE path = ?", (icon_path,)).fetchone()
+        if row and row["thumb_slot"] is not None:
+            slot = row["thumb_slot"]
+        else:
+            slot = next(free_slots if free_slots is not None else self.free_slots())
+
+        mode = 'r+b' if os.path.exists(self.thumbnail_path) else 'w+b'
+        with open(self.thumbnail_path, mode) as f:
+            f.seek(slot * THUMBNAIL_BYTES)
+            f.write(thumbnail)
+
+        largest = sizes[-1]
+        self.db.execute(
+            "UPDATE icons SET sizes = ?, width = COALESCE(width, ?), height = COALESCE(height, ?), "
+            "file_size = ?, mtime_ns = ?, thumb_slot = ? WHERE path = ?",
+            (",".join(str(s[0]) for s in sizes), largest[0], largest[1], stat.st_size, stat.st_mtime_ns, slot, icon_path)
+        )
+
+    def free_slots(self):
+        # Thumbnail slots freed by removed icons first, then new slots at the end of the file.
+        # The used slots are read once, so a whole sync shares a single query.
+        used_slots = {row["thumb_slot"] for row in self.db.execute("SELECT thumb_slot FROM icons WHERE thumb_slot IS NOT NULL")}
+        slot = 0
+        while True:
+            if slot not in used_slots:
+                yield slot
+            slot += 1
+
+    def remove_icons(self, icon_paths, commit=True):
+        icon_paths = [(os.path.abspath(path),) for path in icon_paths]
+        self.db.executemany("DELETE FROM icons WHERE path = ?", icon_paths)
+        self.db.executemany("DELETE FROM tags WHERE path = ?", icon_paths)
+        self.db.executemany("DELETE FROM shortcuts WHERE path = ?", icon_paths)
+        if commit:
+            self.db.commit()
+
+    def sync(self, source_dirs, progress=None):
+        # Index icons added outside Conopida and drop the ones that were deleted;
+        # only new or modified files are decoded, and everything is one transaction.
+        # progress(done, total) is called after each decoded icon.
+        known = dict(self.db.execute("SELECT path, mtime_ns FROM icons").fetchall())
+        new_icons = []
+        changed_icons = []
+        seen = set()
+
+        for source_dir in source_dirs:
+            if not os.path.isdir(source_dir):
+                continue
+            for entry in os.scandir(source_dir):
+                if not entry.name.lower().endswith(".ico") or not entry.is_file():
+                    continue
+                icon_path = os.path.abspath(entry.path)
+                seen.add(icon_path)
+                if icon_path not in known:
+                    new_icons.append(icon_path)
+                elif known[icon_path] != entry.stat().st_mtime_ns:
+                    changed_icons.append(icon_path)
+
+        # Remove first, so the slots of deleted icons are reused
+        self.remove_icons(set(known) - seen, commit=False)
+        free_slots = self.free_slots()
+
+        total = len(changed_icons) + len(new_icons)
+        for done, icon_path in enumerate(changed_icons + new_icons, start=1):
+            try:
+                if done <= len(changed_icons):
+                    self.refresh_icon(icon_path, free_slots, commit=False)
+                else:
+                    self.add_icon(icon_path, "store", free_slots=free_slots, commit=False)
+            except Exception:
+                pass  # Unreadable icons keep their previous entry or stay out of the catalogue
+            if progress:
+                progress(done, total)
+
+        self.db.commit()
+
+    def set_shortcut_icons(self, shortcut_icons, scanned_dirs=(), unreadable=()):
+        # A shortcut uses at most one icon; None clears its entry. Shortcuts directly inside
+        # scanned_dirs that the scan did not see (and could read) no longer exist and are
+        # dropped. Paths are compared with normcase, as Windows may spell them differently.
+        stored_shortcuts = collections.defaultdict(list)
+        for row in self.db.execute("SELECT shortcut FROM shortcuts"):
+            stored_shortcuts[os.path.normcase(row["shortcut"])].append(row["shortcut"])
+        icon_paths = {os.path.normcase(row["path"]): row["path"] for row in self.db.execute("SELECT path FROM icons")}
+
+        seen = {os.path.normcase(os.path.abspath(shortcut_path)) for shortcut_path in unreadable}
+        for shortcut_path, icon_path in shortcut_icons:
+            shortcut_path = os.path.abspath(shortcut_path)
+            key = os.path.normcase(shortcut_path)
+            seen.add(key)
+            for stored_shortcut in stored_shortcuts.pop(key, []):
+                self.db.execute("DELETE FROM shortcuts WHERE shortcut = ?", (stored_shortcut,))
+            if icon_path:
+                # Use the catalogue's spelling of the icon path, so get_shortcuts finds it
+                icon_path = os.path.abspath(icon_path)
+                icon_path = icon_paths.get(os.path.normcase(icon_path), icon_path)
+                self.db.execute("INSERT OR IGNORE INTO shortcuts (path, shortcut) VALUES (?, ?)", (icon_path, shortcut_path))
+
+        scanned_dirs = {os.path.normcase(os.path.abspath(directory)) for directory in scanned_dirs}
+        for key, stored in stored_shortcuts.items():
+            if key not in seen and os.path.dirname(key) in scanned_dirs:
+                self.db.executemany("DELETE FROM shortcuts WHERE shortcut = ?", [(shortcut,) for shortcut in stored])
+        self.db.commit()
+
+    def get_tags(self, icon_path):
+        rows = self.db.execute("SELECT tag FROM tags WHERE path = ? ORDER BY tag", (os.path.abspath(icon_path),))
+        return [row["tag"] for row in rows]
+
+    def set_tags(self, icon_path, tags):
+        icon_path = os.path.abspath(icon_path)
+        self.db.execute("DELETE FROM tags WHERE path = ?", (icon_path,))
+        self.db.executemany("INSERT OR IGNORE INTO tags (path, tag) VALUES (?, ?)", [(icon_path, tag.lower()) for tag in tags])
+        self.db.commit()
+
+    def get_shortcuts(self, icon_path):
+        rows = self.db.execute("SELECT shortcut FROM shortcuts WHERE path = ? ORDER BY shortcut", (os.path.abspath(icon_path),))
+        return [row["shortcut"] for row in rows]
+
+    def _search_filter(self, query):
+        # Every term must match: "kind:url", "tag:web" or a prefix of the name, origin or a tag.
+        # Prefixes are matched as NOCASE ranges so the lookups stay on the indexes.
+        conditions = []
+        params = []
+        for term in query.split():
+            if term.lower().startswith("kind:"):
+                if term[5:]:
+                    conditions.append("origin_kind = ?")
+                    params.append(term[5:].lower())
+                continue
+
+            tag_only = term.lower().startswith("tag:")
+            if tag_only:
+                term = term[4:]
+            if not term:
+                continue  # A bare "tag:" would otherwise match every tagged icon
+            prefix_range = [term, term + "\U0010ffff"]
+            tag_condition = "path IN (SELECT path FROM tags WHERE tag >= ? AND tag < ?)"
+            if tag_only:
+                conditions.append(tag_condition)
+                params.extend(prefix_range)
+            else:
+                conditions.append(f"((name >= ? AND name < ?) OR (origin >= ? AND origin < ?) OR {tag_condition})")
+                params.extend(prefix_range * 3)
+
+        return (" WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+    def search(self, query="", limit=500, offset=0):
+        where, params = self._search_filter(query)
+        sql = f"SELECT * FROM icons{where} ORDER BY added DESC LIMIT ? OFFSET ?"
+        return self.db.execute(sql, params + [limit, offset]).fetchall()
+
+    def count(self, query=""):
+        where, params = self._search_filter(query)
+        return self.db.execute(f"SELECT COUNT(*) FROM icons{where}", params).fetchone()[0]
+
+    def load_thumbnails(self):
+        # Memory-map the whole library; thumbnail() slices only the slots that are drawn.
+        # Close the returned map when done.
+        if not os.path.exists(self.thumbnail_path) or os.path.getsize(self.thumbnail_path) == 0:
+            return b""
+        with open(self.thumbnail_path, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @staticmethod
+    def thumbnail(thumbnails, slot):
+        data = thumbnails[slot * THUMBNAIL_BYTES:(slot + 1) * THUMBNAIL_BYTES]
+        if len(data) != THUMBNAIL_BYTES:
+            data = bytes(THUMBNAIL_BYTES)
+        return Image.frombytes("RGBA", (THUMBNAIL_SIZE, THUMBNAIL_SIZE), data)
+
+def in_source_dirs(icon_path):
+    icon_dir = os.path.normcase(os.path.dirname(os.path.abspath(icon_path)))
+    return any(icon_dir == os.path.normcase(source_dir) for source_dir in config.source_dirs)
+
+def catalogue_applied_icon(icon_path, lnk_path, origin_kind=None, origin="", source_path=None):
+    # Only icons kept in the source directories are catalogued
+    if not in_source_dirs(icon_path):
+        return
+
+    try:
+        with IconCatalogue(config.source_dir) as catalogue:
+            if origin_kind or not catalogue.contains(icon_path):
+                catalogue.add_icon(icon_path, origin_kind or "store", origin, source_path)
+            catalogue.set_shortcut_icons([(lnk_path, icon_path)])
+    except Exception as e:
+        messagebox.showwarning("Warning", f"Failed to update the icon library: {e}")
+
+def iter_shortcuts(directories, recursive=False, on_error=None):
+    # Yields shortcut paths one at a time, so huge trees are never listed in memory at once.
+    # Folders that cannot be listed (including missing ones) are passed to on_error; without
+    # it, missing folders are skipped and other listing errors are raised. Junctions are not
+    # followed, as they can loop back into the tree (like "Application Data" in a profile).
+    for directory in directories:
+        if on_error is None and not os.path.exists(directory):
+            continue
+
+        pending = [directory]
+        while pending:
+            current = pending.pop()
+            try:
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        if entry.is_junction():
+                            continue
+                        if recursive and entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        elif entry.name.lower().endswith(".lnk") and entry.is_file():
+                            yield entry.path
+            except OSError as e:
+                if on_error is None:
+                    raise
+                on_error(e)
+
+def iter_shortcut_records(shortcut_paths, source_dirs=(), check_targets=False):
+    """Yield one audit record per shortcut.
+
+    The status is the first that applies: "unreadable" (with the error),
+    "missing_icon", "missing_target", "foreign_icon" (an .ico outside the
+    source directories) or "ok". Each shortcut is read from a temporary copy.
+    Targets are only checked with check_targets, since a target on an offline
+    share can stall every lookup.
+    """
+    temp_dir = tempfile.gettempdir()
+    source_dirs = [os.path.normcase(source_dir) for source_dir in source_dirs]
+
+    pythoncom.CoInitialize()
+    try:
+        shell = win32com.client.Dispatch("WScript.Shell")
+        for shortcut_path in shortcut_paths:
+            record = {"path": shortcut_path, "target": "", "icon": "", "status": "ok", "error": ""}
+            temp_shortcut_path = os.path.join(temp_dir, f"temp_shortcut_{generate_crc32_name()}.lnk")
+            try:
+                shutil.copy(shortcut_path, temp_shortcut_path)
+                shortcut = shell.CreateShortcut(temp_shortcut_path)
+                record["target"] = os.path.expandvars(shortcut.TargetPath or "")
+                icon_path = os.path.expandvars(shortcut.IconLocation.split(",")[0].strip())
+
+                icon_exists = bool(icon_path) and os.path.exists(icon_path)
+                record["icon"] = os.path.abspath(icon_path) if icon_exists else icon_path
+
+                if icon_path and not icon_exists:
+                    record["status"] = "missing_icon"
+                elif check_targets and record["target"] and not os.path.exists(record["target"]):
+                    record["status"] = "missing_target"
+                elif icon_exists and icon_path.lower().endswith(".ico") and os.path.normcase(os.path.dirname(record["icon"])) not in source_dirs:
+                    record["status"] = "foreign_icon"
+            except Exception as e:
+                record["status"] = "unreadable"
+                record["error"] = f"{type(e).__name__}: {e}"
+            finally:
+                if os.path.exists(temp_shortcut_path):
+                    os.remove(temp_shortcut_path)
+            yield record
+    finally:
+        pythoncom.CoUninitialize()
+
+def scan_shortcut_icons(directories):
+    # Returns the set of icons used by the shortcuts in the directories, the
+    # (shortcut, icon) pairs for the icon library, the (shortcut, error) pairs
+    # of shortcuts that could not be read and the (shortcut, icon) pairs of icons
+    # that were not found. Safe to call from worker threads.
+    used_icons = set()
+    shortcut_icons = []
+    unreadable = []
+    missing_icons = []
+
+    for record in iter_shortcut_records(iter_shortcuts(directories)):
+        if record["status"] == "unreadable":
+            unreadable.append((record["path"], record["error"]))
+            continue
+        if record["status"] == "missing_icon":
+            missing_icons.append((record["path"], record["icon"]))
+        if record["icon"] and record["status"] != "missing_icon":
+            used_icons.add(record["icon"])
+            shortcut_icons.append((record["path"], record["icon"]))
+        else:
+            shortcut_icons.append((record["path"], None))
+
+    return used_icons, shortcut_icons, unreadable, missing_icons
+
+def icon_file_names(icon_dirs):
+    # The normcased names of the icons in the directories
+    names = set()
+    for icon_dir in icon_dirs:
+        if os.path.exists(icon_dir):
+            names.update(os.path.normcase(file_name) for file_name in os.listdir(icon_dir) if file_name.lower().endswith(".ico"))
+    return names
+
+def find_orphaned_icons(icon_dirs, used_icons):
+    # Icons are matched by file name: store icons have unique CRC32 names, while shortcuts
+    # may reach the store through another drive letter, a UNC path or a different spelling
+    used_names = {os.path.normcase(os.path.basename(icon_path)) for icon_path in used_icons}
+    orphaned_icons = []
+    for dir_to_check in icon_dirs:
+        if os.path.exists(dir_to_check):
+            for file_name in os.listdir(dir_to_check):
+                if file_name.lower().endswith(".ico"):
+                    if os.path.normcase(file_name) in used_names:
+                        continue
+                    orphaned_icons.append(os.path.abspath(os.path.join(dir_to_check, file_name)))
+    return orphaned_icons
+
+def replace_backup(source_dirs, backup_dir):
+    # Make the backup directory an exact copy of the icons in the source directories
+    ensure_valid_directory(backup_dir)
+    for file_name in os.listdir(backup_dir):
+        file_path = os.path.join(backup_dir, file_name)
+        if os.path.isfile(file_path):
+            os.remove(file_path)
+
+    copy_icons_to_backup(source_dirs, backup_dir)
+
+def update_catalogue_after_purge(deleted_icons, shortcut_icons, scanned_dirs, unreadable=()):
+    # Keep the icon library in step with the store and the scanned shortcuts
+    with IconCatalogue(config.source_dir) as catalogue:
+        catalogue.remove_icons(deleted_icons)
+        catalogue.set_shortcut_icons(shortcut_icons, scanned_dirs, unreadable)
+
 def browse_lnk():
     file_path = filedialog.askopenfilename(filetypes=[("Shortcut files", "*.lnk")])
     lnk_entry.delete(0, tk.END)
@@ -247,6 +939,14 @@ def apply_icon():
             root.update_idletasks()
             return
 
+        # Remember where the image came from for the icon library
+        if png_or_url == "<clipboard input>":
+            origin_kind, origin = "clipboard", ""
+        elif png_or_url.startswith(("http://", "https://")):
+            origin_kind, origin = "url", png_or_url
+        else:
+            origin_kind, origin = "file", os.path.abspath(png_or_url)
+
         # Replace <clipboard input> with the path of the clipboard image file
         if png_or_url == "<clipboard input>":
             if temp_image_path and os.path.exists(temp_image_path):
@@ -292,12 +992,26 @@ def apply_icon():
 
             if decision.get() == 1:  # Option 1: Use the original `.ico` path
                 icon_path = png_or_url
+                origin_kind = None  # Not a new icon; only its use is catalogued
+                source_path = None
             elif decision.get() == 2:  # Option 2: Copy `.ico` to the source directory with CRC32-encoded name
-                source_dir = read_directory_from_file(SOURCE_DIR_FILE)
-                ensure_valid_directory(source_dir)
+                if not validate_sourcedir():
+                    progress_var.set(0)
+                    root.update_idletasks()
+                    return
                 icon_name = f"{generate_crc32_name()}.ico"
-                icon_path = os.path.join(source_dir, icon_name)
+                icon_path = os.path.join(config.source_dir, icon_name)
+                ensure_valid_directory(config.source_dir)
                 shutil.copy(png_or_url, icon_path)
+                source_path = png_or_url
+
+                # Shrink the copy to the configured size set; an ICO Pillow cannot
+                # re-encode is kept exactly as it was copied
+                if not config.icon_sizes_error:
+                    try:
+                        optimize_icon_file(icon_path, config.icon_sizes)
+                    except Exception as e:
+                        messagebox.showwarning("Warning", f"The icon was copied unchanged because it could not be optimized: {e}")
             else:
                 # If no valid decision, cancel operation
                 messagebox.showinfo("Info", "Operation cancelled.")
@@ -348,6 +1062,9 @@ def apply_icon():
                     root.update_idletasks()
                     return
 
+            # Hash the downloaded or local file, not the intermediate PNG
+            source_path = png_or_url
+
             # Handle SVG files
             if png_or_url.lower().endswith(".svg"):
                 temp_png_path = os.path.join(temp_dir, "temp_converted_image.png")
@@ -368,9 +1085,10 @@ def apply_icon():
 
             # Generate ICO from other image types
             try:
-                source_dir = read_directory_from_file(SOURCE_DIR_FILE)
-                ensure_valid_directory(source_dir)
-                icon_save_path = create_icon_with_multiple_sizes(png_or_url, source_dir)
+                config.reload()
+                if config.source_error or config.icon_sizes_error:
+                    raise ValueError(config.source_error or config.icon_sizes_error)
+                icon_save_path = create_icon_with_multiple_sizes(png_or_url, config.source_dir, config.icon_sizes)
                 icon_path = icon_save_path
                 progress_var.set(70)  # Progress: Icon created
                 root.update_idletasks()
@@ -391,6 +1109,8 @@ def apply_icon():
             original_name = os.path.basename(lnk_path)
             shutil.move(temp_shortcut_path, lnk_path)
 
+            catalogue_applied_icon(icon_path, lnk_path, origin_kind, origin, source_path)
+
             progress_var.set(100)
             root.update_idletasks()
             messagebox.showinfo("Success", f"Icon applied successfully to '{lnk_path}'!")
@@ -470,8 +1190,11 @@ def delete_orphaned_icons():
         omit_dirs = [os.path.abspath(omit) for omit in omit_dirs]
 
         # === STEP 2: Validate source directory ===
-        source_dir = read_directory_from_file(SOURCE_DIR_FILE)
-        ensure_valid_directory(source_dir)
+        if config.source_error:
+            messagebox.showerror("Error", config.source_error)
+            progress_var.set(0)
+            return
+        source_dirs = config.source_dirs
         progress_var.set(20)
         root.update_idletasks()
 
@@ -489,86 +1212,42 @@ def delete_orphaned_icons():
         root.update_idletasks()
 
         # === STEP 5: Process shortcuts (including OMIT_PURGE_FILE paths) ===
-        directories_to_check = [desktop_path] + omit_dirs
-
-        desktop_shortcuts = []
-        for directory in directories_to_check:
-            if os.path.exists(directory):
-                desktop_shortcuts.extend([
-                    os.path.join(directory, f)
-                    for f in os.listdir(directory)
-                    if f.lower().endswith(".lnk")
-                ])
-
-        used_icons = set()
-        temp_dir = tempfile.gettempdir()
-        temp_shortcuts = []
-
-        shell = win32com.client.Dispatch("WScript.Shell")
-        for shortcut_path in desktop_shortcuts:
-            try:
-                temp_shortcut_name = f"temp_shortcut_{generate_crc32_name()}.lnk"
-                temp_shortcut_path = os.path.join(temp_dir, temp_shortcut_name)
-                shutil.copy(shortcut_path, temp_shortcut_path)
-                temp_shortcuts.append(temp_shortcut_path)
-
-                shortcut = shell.CreateShortcut(temp_shortcut_path)
-                icon_path = os.path.expandvars(shortcut.IconLocation.split(",")[0].strip())
-                if icon_path and os.path.exists(icon_path):
-                    used_icons.add(os.path.abspath(icon_path))
-
-            except Exception:
-                pass  # Silently ignore broken or unreadable shortcuts
+        used_icons, shortcut_icons, unreadable, missing_icons = scan_shortcut_icons([desktop_path] + omit_dirs)
+        used_icons |= {icon_path for _, icon_path in missing_icons}  # Keep store icons they name
 
         progress_var.set(60)
         root.update_idletasks()
 
         # === STEP 6: Identify orphaned icons ===
-        orphaned_icons = []
-        for dir_to_check in [source_dir] + omit_dirs:
-            if os.path.exists(dir_to_check):
-                for file_name in os.listdir(dir_to_check):
-                    if file_name.lower().endswith(".ico"):
-                        icon_path = os.path.abspath(os.path.join(dir_to_check, file_name))
-                        if icon_path in used_icons:
-                            continue
-                        orphaned_icons.append(icon_path)
+        orphaned_icons = find_orphaned_icons(source_dirs + omit_dirs, used_icons)
 
         # === STEP 7: Delete orphaned icons ===
+        deleted_icons = []
         for icon_path in orphaned_icons:
             try:
                 os.remove(icon_path)
+                deleted_icons.append(icon_path)
             except Exception as e:
                 messagebox.showwarning("Warning", f"Failed to delete orphaned icon '{icon_path}': {e}")
 
+        try:
+            update_catalogue_after_purge(
+                deleted_icons, shortcut_icons, [desktop_path] + omit_dirs,
+                [shortcut_path for shortcut_path, _ in unreadable]
+            )
+        except Exception as e:
+            messagebox.showwarning("Warning", f"Failed to update the icon library: {e}")
+
         progress_var.set(80)
         root.update_idletasks()
 
         # === STEP 8: Update backup ===
         if backup_dir:
             try:
-                for file_name in os.listdir(backup_dir):
-                    file_path = os.path.join(backup_dir, file_name)
-                    if os.path.isfile(file_path):
-                        os.remove(file_path)
-
-                for file_name in os.listdir(source_dir):
-                    if file_name.lower().endswith(".ico"):
-                        shutil.copy(
-                            os.path.join(source_dir, file_name),
-                            os.path.join(backup_dir, file_name)
-                        )
+                replace_backup(source_dirs, backup_dir)
             except Exception as e:
                 messagebox.showwarning("Warning", f"Failed to update backup directory: {e}")
 
-        # === STEP 9: Clean up temp shortcuts ===
-        for temp_shortcut in temp_shortcuts:
-            try:
-                if os.path.exists(temp_shortcut):
-                    os.remove(temp_shortcut)
-            except Exception:
-                pass  # Ignore if temp file is already gone
-
         progress_var.set(100)
         root.update_idletasks()
         messagebox.showinfo("Success", "Orphaned icons deleted and backup replaced successfully!")
@@ -621,6 +1300,150 @@ def paste_image_from_clipboard():
     except Exception as e:
         messagebox.showerror("Error", f"An error occurred: {e}")
 
+def open_icon_library():
+    if not validate_sourcedir():
+        return
+
+    # Index new icons in the background; the first sync of a large store decodes every ICO
+    library_button.config(state="disabled")
+    progress_var.set(0)
+    state = {"done": 0, "total": 0, "error": None, "finished": False}
+    source_dir = config.source_dir
+    source_dirs = list(config.source_dirs)
+
+    def report(done, total):
+        state["done"] = done
+        state["total"] = total
+
+    def sync_worker():
+        # SQLite connections cannot be shared between threads, so the worker opens its own
+        try:
+            with IconCatalogue(source_dir) as catalogue:
+                catalogue.sync(source_dirs, progress=report)
+        except Exception as e:
+            state["error"] = e
+        state["finished"] = True
+
+    def poll():
+        if state["total"]:
+            progress_var.set(100 * state["done"] / state["total"])
+        if not state["finished"]:
+            root.after(100, poll)
+            return
+
+        progress_var.set(0)
+        library_button.config(state="normal")
+        if state["error"]:
+            messagebox.showerror("Error", f"Failed to open the icon library: {state['error']}")
+            return
+        show_icon_library()
+
+    threading.Thread(target=sync_worker, daemon=True).start()
+    poll()
+
+def show_icon_library():
+    try:
+        catalogue = IconCatalogue(config.source_dir)
+        thumbnails = catalogue.load_thumbnails()  # Mapped once; every redraw slices from it
+    except Exception as e:
+        messagebox.showerror("Error", f"Failed to open the icon library: {e}")
+        return
+
+    library = tk.Toplevel(root)
+    library.title("Icon Library")
+    library.geometry("560x420")
+
+    search_var = tk.StringVar()
+    tk.Label(library, text="Search (start of a name, URL or tag, tag:..., kind:file/url/clipboard/store):").pack(anchor="w", padx=10, pady=(10, 0))
+    search_entry = tk.Entry(library, textvariable=search_var, width=60)
+    search_entry.pack(fill="x", padx=10, pady=5)
+
+    grid_frame = tk.Frame(library)
+    grid_frame.pack(fill="both", expand=True, padx=10)
+    canvas = tk.Canvas(grid_frame, background="white")
+    scrollbar = tk.Scrollbar(grid_frame, orient="vertical", command=canvas.yview)
+    scrollbar.pack(side="right", fill="y")
+    canvas.pack(side="left", fill="both", expand=True)
+
+    status_label = tk.Label(library, anchor="w")
+    status_label.pack(fill="x", padx=10, pady=(0, 5))
+
+    cell_width = 76
+    cell_height = 64
+    page_size = 300
+    photos = []  # Keep references so Tk does not discard the images
+    results = {"shown": 0, "total": 0, "columns": 1}
+
+    def pick(icon_path):
+        png_entry.delete(0, tk.END)
+        png_entry.insert(0, icon_path)
+        close()
+
+    def edit_tags(icon_path):
+        tags = simpledialog.askstring(
+            "Tags", "Tags (separated by spaces):",
+            initialvalue=" ".join(catalogue.get_tags(icon_path)), parent=library
+        )
+        if tags is not None:
+            catalogue.set_tags(icon_path, tags.split())
+            refresh()
+
+    def load_more():
+        # Draw the next page of results below the ones already shown
+        if results["shown"] >= results["total"]:
+            return
+
+        columns = results["columns"]
+        icons = catalogue.search(search_var.get(), limit=page_size, offset=results["shown"])
+        for index, icon in enumerate(icons, start=results["shown"]):
+            x = (index % columns) * cell_width + cell_width // 2
+            y = (index // columns) * cell_height + THUMBNAIL_SIZE // 2 + 4
+            photo = ImageTk.PhotoImage(catalogue.thumbnail(thumbnails, icon["thumb_slot"]))
+            photos.append(photo)
+
+            for item in (
+                canvas.create_image(x, y, image=photo),
+                canvas.create_text(x, y + THUMBNAIL_SIZE // 2 + 8, text=(icon["name"] or "")[:10], font=("TkDefaultFont", 8))
+            ):
+                canvas.tag_bind(item, "<Button-1>", lambda event, path=icon["path"]: pick(path))
+                canvas.tag_bind(item, "<Button-3>", lambda event, path=icon["path"]: edit_tags(path))
+
+        results["shown"] += len(icons)
+        if not icons:
+            results["total"] = results["shown"]  # The library shrank while browsing
+        rows = -(-results["shown"] // columns)
+        canvas.configure(scrollregion=(0, 0, columns * cell_width, rows * cell_height))
+        status_label.configure(text=f"Showing {results['shown']} of {results['total']} icons")
+
+    def refresh(*_):
+        canvas.delete("all")
+        photos.clear()
+        canvas.yview_moveto(0)
+        results["shown"] = 0
+        results["total"] = catalogue.count(search_var.get())
+        results["columns"] = max(1, canvas.winfo_width() // cell_width)
+        load_more()
+
+    def on_scroll(first, last):
+        # Load the next page once the view gets close to the bottom
+        scrollbar.set(first, last)
+        if float(last) >= 0.95 and results["shown"] < results["total"]:
+            library.after_idle(load_more)
+
+    def close():
+        photos.clear()
+        if isinstance(thumbnails, mmap.mmap):
+            thumbnails.close()
+        catalogue.close()
+        library.destroy()
+
+    canvas.configure(yscrollcommand=on_scroll)
+    canvas.bind("<MouseWheel>", lambda event: canvas.yview_scroll(int(-event.delta / 120), "units"))
+    search_var.trace_add("write", refresh)
+    canvas.bind("<Configure>", refresh)
+    library.protocol("WM_DELETE_WINDOW", close)
+    search_entry.focus_set()
+
 def revert_shortcut_icon():
     global temp_shortcut_path  # Track temporary shortcut file
 
@@ -702,13 +1525,320 @@ def revert_shortcut_icon():
 
         messagebox.showerror("Error", f"An unexpected error occurred while reverting the shortcut: {e}")
 
+class CommandLog:
+    """
+    Prints the messages of a command and, when a log file is given, appends them to it
+    as well. The released Conopida.exe has no console, so the log is the only record there.
+    """
+
+    def __init__(self, log_path=None):
+        self.log = None
+        if log_path:
+            self.log = open(log_path, 'a', encoding='utf-8')
+            self.write(f"--- {time.strftime('%Y-%m-%d %H:%M:%S')} {' '.join(sys.argv[1:])}".rstrip())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.log:
+            self.log.close()
+            self.log = None
+
+    def info(self, message):
+        print(message)  # Discarded when there is no console
+        self.write(message)
+
+    def error(self, message):
+        print(message, file=sys.stderr)
+        self.write(message)
+
+    def write(self, message):
+        if self.log:
+            self.log.write(message + "\n")
+            self.log.flush()  # Keep what was logged if the command fails later
+
+def command_catalogue(args):
+    with IconCatalogue(config.source_dir) as catalogue:
+        catalogue.sync(config.source_dirs)
+        for icon in catalogue.search(" ".join(args.query), limit=args.limit):
+            tags = " ".join(catalogue.get_tags(icon["path"]))
+            print(f"{icon['path']}\t{icon['name']}\t{icon['origin_kind']}\t{icon['sizes']}\t{tags}")
+    return 0
+
+def command_optimize(args):
+    with CommandLog(args.log) as log:
+        return optimize_source_icons(args, log)
+
+def optimize_source_icons(args, log):
+    if config.icon_sizes_error:
+        log.error(config.icon_sizes_error)
+        return 1
+
+    total_before = total_after = 0
+    optimized_icons = []
+    for source_dir in config.source_dirs:
+        if not os.path.isdir(source_dir):
+            continue
+        for file_name in sorted(os.listdir(source_dir)):
+            if not file_name.lower().endswith(".ico"):
+                continue
+            icon_path = os.path.join(source_dir, file_name)
+            try:
+                before, after = optimize_icon_file(icon_path, config.icon_sizes, args.png_min_size, args.dry_run)
+            except Exception as e:
+                log.error(f"Skipped '{icon_path}': {e}")
+                continue
+
+            total_before += before
+            total_after += after
+            if after < before:
+                optimized_icons.append(icon_path)
+                log.info(f"{icon_path}: {before} -> {after} bytes")
+
+    saved = total_before - total_after
+    percent = 100 * saved / total_before if total_before else 0
+    verb = "Would save" if args.dry_run else "Saved"
+    log.info(f"{verb} {saved} bytes ({percent:.1f}%) by rewriting {len(optimized_icons)} icons ({total_before} -> {total_after} bytes)")
+
+    if args.dry_run or not optimized_icons:
+        return 0
+
+    # Refresh the backup copies and the catalogue entries of the rewritten icons only
+    if config.backup_error:
+        log.error(config.backup_error)
+    elif config.backup_dir:
+        ensure_valid_directory(config.backup_dir)
+        for icon_path in optimized_icons:
+            shutil.copy(icon_path, os.path.join(config.backup_dir, os.path.basename(icon_path)))
+
+    with IconCatalogue(config.source_dir) as catalogue:
+        catalogue.sync(config.source_dirs)
+    return 0
+
+def command_fleet(args):
+    with CommandLog(args.log) as log:
+        return purge_fleet_icons(args, log)
+
+def purge_fleet_icons(args, log):
+    # Purge against the merged shortcuts of many profiles that share one icon store
+    if config.omit_error:
+        log.error(config.omit_error)
+        return 1
+    if config.omit_dirs is None or config.omit_errors:
+        log.error("\n".join(config.omit_errors + ["Process stopped to prevent data loss."]))
+        return 1
+
+    profile_roots = list(args.roots)
+    if args.roots_file:
+        try:
+            with open(args.roots_file, 'r', encoding='utf-8-sig') as f:
+                profile_roots.extend(line.strip() for line in f if line.strip())
+        except OSError as e:
+            log.error(f"Failed to read '{args.roots_file}': {e}")
+            return 1
+    if not profile_roots:
+        log.error("No profile roots given.")
+        return 1
+
+    shortcut_dirs = []
+    for profile_root in profile_roots:
+        shortcut_dir = os.path.join(profile_root, args.subdir)
+        if not os.path.isabs(profile_root) or not os.path.isdir(shortcut_dir):
+            log.error(f"'{shortcut_dir}' is not an existing absolute path. Process stopped to prevent data loss.")
+            return 1
+        shortcut_dirs.append(shortcut_dir)
+
+    # One scan per profile plus one for the shared omit directories. Every scan and every
+    # shortcut must be read: an unreachable profile or a locked shortcut could be the
+    # only user of a shared icon. So must every icon a shortcut names from the store, as
+    # it may only be missing because %USERPROFILE% or a drive expands differently here.
+    icon_dirs = config.source_dirs + config.omit_dirs
+    store_names = icon_file_names(icon_dirs)
+    used_icons = set()
+    shortcut_icons = []
+    failures = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        scans = {executor.submit(scan_shortcut_icons, [shortcut_dir]): shortcut_dir for shortcut_dir in shortcut_dirs}
+        scans[executor.submit(scan_shortcut_icons, config.omit_dirs)] = "omit directories"
+        for scan in concurrent.futures.as_completed(scans):
+            try:
+                profile_icons, profile_shortcuts, unreadable, missing_icons = scan.result()
+            except Exception as e:
+                failures.append(f"{scans[scan]}: {e}")
+                continue
+            failures.extend(f"{shortcut_path}: {error}" for shortcut_path, error in unreadable)
+            failures.extend(
+                f"{shortcut_path}: icon '{icon_path}' not found, but the store has an icon of that name"
+                for shortcut_path, icon_path in missing_icons
+                if os.path.normcase(os.path.basename(icon_path)) in store_names
+            )
+            used_icons |= profile_icons
+            shortcut_icons.extend(profile_shortcuts)
+
+    log.info(f"Scanned {len(shortcut_icons)} shortcuts in {len(shortcut_dirs)} profiles, {len(used_icons)} icons in use")
+    if failures:
+        log.error("\n".join(["Failed to scan:"] + failures + ["Process stopped to prevent data loss."]))
+        return 1
+
+    orphaned_icons = find_orphaned_icons(icon_dirs, used_icons)
+    if args.dry_run:
+        for icon_path in orphaned_icons:
+            log.info(f"Would delete '{icon_path}'")
+        log.info(f"{len(orphaned_icons)} orphaned icons")
+        return 0
+
+    deleted_icons = []
+    for icon_path in orphaned_icons:
+        try:
+            os.remove(icon_path)
+            deleted_icons.append(icon_path)
+            log.info(f"Deleted '{icon_path}'")
+        except Exception as e:
+            log.error(f"Failed to delete orphaned icon '{icon_path}': {e}")
+    log.info(f"Deleted {len(deleted_icons)} of {len(orphaned_icons)} orphaned icons")
+
+    try:
+        update_catalogue_after_purge(deleted_icons, shortcut_icons, shortcut_dirs + config.omit_dirs)
+    except Exception as e:
+        log.error(f"Failed to update the icon library: {e}")
+
+    # The backup is synced once, after every profile has been handled
+    if config.backup_error:
+        log.error(config.backup_error)
+    elif config.backup_dir:
+        try:
+            replace_backup(config.source_dirs, config.backup_dir)
+        except Exception as e:
+            log.error(f"Failed to update backup directory: {e}")
+            return 1
+    return 0
+
+def command_audit(args):
+    directories = args.directories
+    if not directories:
+        # Same places the orphan purge looks at
+        directories = [os.path.join(os.environ["USERPROFILE"], "Desktop")] + (config.omit_dirs or [])
+
+    output_format = args.format
+    if not output_format:
+        output_format = "csv" if args.output.lower().endswith(".csv") else "jsonl"
+
+    if args.output != "-":
+        output = open(args.output, 'w', encoding='utf-8', newline='')
+    elif sys.stdout is None:
+        # Windowed builds have no standard output
+        return 1
+    else:
+        # UTF-8 without newline translation, so CSV rows do not end in \r\r\n on Windows
+        sys.stdout.flush()
+        output = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', newline='')
+
+    counts = collections.Counter()
+    summary = None
+    try:
+        if output_format == "csv":
+            writer = csv.DictWriter(output, fieldnames=AUDIT_FIELDS)
+            writer.writeheader()
+            write = writer.writerow
+        else:
+            def write(record):
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        def walk_error(error):
+            # Report folders that cannot be listed instead of skipping them silently
+            counts["unreadable"] += 1
+            write({"path": error.filename, "target": "", "icon": "", "status": "unreadable", "error": f"{type(error).__name__}: {error}"})
+
+        # Records are written as they are produced; only the status counts are kept
+        shortcuts = iter_shortcuts(directories, args.recursive, walk_error)
+        for record in iter_shortcut_records(shortcuts, config.source_dirs, check_targets=True):
+            counts[record["status"]] += 1
+            write(record)
+
+        # The summary ends a JSON Lines report; a CSV file gets it in a sibling file,
+        # so the report keeps one kind of row
+        summary = {"entries": sum(counts.values())}
+        summary.update((status, counts[status]) for status in AUDIT_STATUSES)
+        if output_format == "jsonl":
+            output.write(json.dumps({"summary": summary}) + "\n")
+        elif args.output != "-":
+            with open(f"{os.path.splitext(args.output)[0]}.summary.json", 'w', encoding='utf-8') as f:
+                json.dump(summary, f, indent=2)
+    finally:
+        if args.output == "-":
+            output.flush()
+            output.detach()  # Leave sys.stdout open
+        else:
+            output.close()
+
+    statuses = ", ".join(f"{status}: {summary[status]}" for status in AUDIT_STATUSES)
+    print(f"Audited {summary['entries']} entries ({statuses})", file=sys.stderr)
+    return 0
+
+# Command line options
+parser = argparse.ArgumentParser(description="Icon manager for Windows shortcuts")
+parser.add_argument(
+    "--profile",
+    default=os.environ.get("CONOPIDA_PROFILE"),
+    help="Use the _sourcedir.<profile>.txt configuration set"
+)
+subparsers = parser.add_subparsers(dest="command")
+
+catalogue_parser = subparsers.add_parser("catalogue", help="Index the source directories and search the icon library")
+catalogue_parser.add_argument("query", nargs="*", help="Search terms, e.g. firefox, tag:web or kind:url")
+catalogue_parser.add_argument("--limit", type=int, default=50, help="Maximum number of results to list")
+catalogue_parser.set_defaults(handler=command_catalogue)
+
+optimize_parser = subparsers.add_parser("optimize", help="Re-encode the icons in the source directories to save space")
+optimize_parser.add_argument(
+    "--png-min-size",
+    type=int,
+    default=PNG_FRAME_MIN_SIZE,
+    help="Store frames at least this wide as PNG and smaller ones as bitmaps (default: %(default)s, all PNG)"
+)
+optimize_parser.add_argument("--dry-run", action="store_true", help="Only report how many bytes would be saved")
+optimize_parser.add_argument("--log", help="Also append the report to this file (the windowed Conopida.exe has no console)")
+optimize_parser.set_defaults(handler=command_optimize)
+
+fleet_parser = subparsers.add_parser("fleet", help="Delete icons orphaned across many user profiles sharing one icon store")
+fleet_parser.add_argument("roots", nargs="*", help="Profile roots or mounted shares, e.g. C:\\Users\\alice")
+fleet_parser.add_argument("--roots-file", help="Text file with one profile root per line")
+fleet_parser.add_argument("--subdir", default="Desktop", help="Shortcut folder inside each profile root (default: %(default)s)")
+fleet_parser.add_argument("--workers", type=int, default=8, help="Number of profiles scanned at once (default: %(default)s)")
+fleet_parser.add_argument("--dry-run", action="store_true", help="Only list the icons that would be deleted")
+fleet_parser.add_argument("--log", help="Also append the output to this file (the windowed Conopida.exe has no console)")
+fleet_parser.set_defaults(handler=command_fleet)
+
+audit_parser = subparsers.add_parser("audit", help="Report missing icons, broken targets and icons outside the source directories")
+audit_parser.add_argument("directories", nargs="*", help="Folders to audit (default: your Desktop and the _omitpurge.txt folders)")
+audit_parser.add_argument("--recursive", action="store_true", help="Also audit shortcuts in subfolders")
+audit_parser.add_argument("--output", default="-", help="File to write the report to (default: standard output, which windowed builds lack)")
+audit_parser.add_argument("--format", choices=["jsonl", "csv"], help="Report format (default: from the output file extension, else jsonl)")
+audit_parser.set_defaults(handler=command_audit)
+
+args = parser.parse_args()
+
+# Load the configuration once; operations re-read it only when a file changes
+config = ConopidaConfig(args.profile)
+
+# Headless commands run without the GUI
+if args.command:
+    if config.source_error:
+        print(config.source_error, file=sys.stderr)
+        sys.exit(1)
+    sys.exit(args.handler(args))
+
 # Validation before launching GUI
 if not validate_sourcedir():
     sys.exit()
 
 # GUI Setup
 root = TkinterDnD.Tk()
-root.title("Conopida")
+root.title(f"Conopida [{config.profile}]" if config.profile else "Conopida")
 
 # Center the window on the screen
 window_width = 580
@@ -739,7 +1869,7 @@ paste_button.grid(row=1, column=3)
 
 # Button Group
 button_frame = tk.Frame(root)  # Create a frame for the buttons
-button_frame.grid(row=2, column=0, columnspan=3, pady=20)  # Position the frame
+button_frame.grid(row=2, column=0, columnspan=4, pady=20)  # Position the frame
 
 # Apply Button
 apply_button = tk.Button(button_frame, text="Apply", command=apply_icon, width=15)
@@ -753,6 +1883,10 @@ delete_orphaned_button.pack(side="left", padx=5)
 revert_button = tk.Button(button_frame, text="Revert to Default", command=revert_shortcut_icon, width=20)
 revert_button.pack(side="left", padx=5)
 
+# Icon Library Button
+library_button = tk.Button(button_frame, text="Icon Library", command=open_icon_library, width=12)
+library_button.pack(side="left", padx=5)
+
 # Drag-and-Drop Support
 lnk_entry.drop_target_register(DND_FILES)
 lnk_entry.dnd_bind('<<Drop>>', on_drop_lnk)